@@ -0,0 +1,112 @@
+import random
+
+# ----------------------------------
+# Board Helpers
+# ----------------------------------
+# Shared by the pygame client and the server's bot workers, so nothing in here
+# may touch pygame or global state: every function takes the board it works on.
+def new_board(rows=3, cols=3):
+    return [[None for _ in range(cols)] for _ in range(rows)]
+
+def available_moves(board):
+    return [(r, c) for r in range(len(board)) for c in range(len(board[r])) if board[r][c] is None]
+
+def check_winner(board):
+    for row in range(3):
+        if board[row][0] == board[row][1] == board[row][2] and board[row][0] is not None:
+            return board[row][0]
+    for col in range(3):
+        if board[0][col] == board[1][col] == board[2][col] and board[0][col] is not None:
+            return board[0][col]
+    if board[0][0] == board[1][1] == board[2][2] and board[0][0] is not None:
+        return board[0][0]
+    if board[0][2] == board[1][1] == board[2][0] and board[0][2] is not None:
+        return board[0][2]
+    if all(cell is not None for row in board for cell in row):
+        return "Draw"
+    return None
+
+# ----------------------------------
+# AI (always plays "O")
+# ----------------------------------
+def minimax(board, depth, is_maximizing):
+    winner = check_winner(board)
+    if winner == "O":  # AI wins
+        return 10 - depth  # Winning faster is better
+    elif winner == "X":  # Player wins
+        return depth - 10  # Losing later is better (forces mistakes)
+    elif winner == "Draw":
+        return 0  # Neutral value for draw
+
+    if is_maximizing:
+        best_score = -float("inf")
+        for row, col in available_moves(board):
+            board[row][col] = "O"
+            score = minimax(board, depth + 1, False)
+            board[row][col] = None
+            best_score = max(best_score, score)
+        return best_score
+    else:
+        best_score = float("inf")
+        for row, col in available_moves(board):
+            board[row][col] = "X"
+            score = minimax(board, depth + 1, True)
+            board[row][col] = None
+            best_score = min(best_score, score)
+        return best_score
+
+
+def can_set_trap(board):
+    for row, col in available_moves(board):
+        board[row][col] = "O"  # Temporarily place AI move
+        win_paths = 0  # Count how many ways this leads to a win
+
+        # Check if making this move results in two simultaneous threats
+        if check_winner(board) == "O":
+            win_paths += 1  # First winning path detected
+
+        # Now check for another potential win path after blocking
+        opponent_moves = available_moves(board)
+        for op_row, op_col in opponent_moves:
+            board[op_row][op_col] = "X"  # Simulate opponent's best blocking move
+            if check_winner(board) == "O":
+                win_paths += 1  # Another winning path detected
+            board[op_row][op_col] = None  # Undo opponent simulation
+
+        board[row][col] = None  # Undo AI simulation
+
+        if win_paths >= 2:
+            return row, col  # If two threats exist, return this trap move
+
+    return None  # No trap available
+
+def best_minimax_move(board):
+    best_score = -float("inf")
+    best_move = None
+    for row, col in available_moves(board):
+        board[row][col] = "O"
+        score = minimax(board, 0, False)
+        board[row][col] = None
+        if score > best_score:
+            best_score = score
+            best_move = (row, col)
+    return best_move
+
+def ai_move(board, difficulty):
+    if difficulty == "easy":
+        moves = available_moves(board)
+        if moves:
+            return random.choice(moves)
+    elif difficulty == "medium":
+        if random.random() < 0.25:
+            moves = available_moves(board)
+            if moves:
+                return random.choice(moves)
+        return best_minimax_move(board)
+    else:  # Hard mode
+        trap_move = can_set_trap(board)
+        if trap_move:
+            return trap_move  # Prioritize trapping the opponent
+
+        # Otherwise, use standard minimax logic
+        return best_minimax_move(board)
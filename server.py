@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import zlib
+import random
+import secrets
+import asyncio
+import collections
+import multiprocessing
+import concurrent.futures
+import socketio
+from aiohttp import web
+import game_logic
+
+# ----------------------------------
+# Server Settings
+# ----------------------------------
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5000))  # Render passes the port in $PORT.
+ROOM_CODE_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+SHARDS = int(os.environ.get("SHARDS", 1))  # Worker processes; shard i listens on PORT + i.
+SHARD_URL = os.environ.get("SHARD_URL")  # e.g. "https://ttt-{shard}.example.com"; defaults to this host on PORT + shard.
+SHARD_ID = 0  # Set in each worker process by run_shard().
+DEFAULT_VARIANT = "3x3"
+VARIANTS = ("3x3",)  # Board variants quick match will queue for.
+WAIT_SAMPLES = 1000  # How many quick-match wait times /metrics reports on.
+# The per-host bot budget is split evenly between the shards.
+BOT_WORKERS = max(1, int(os.environ.get("BOT_WORKERS", os.cpu_count() or 1)) // SHARDS)  # Processes running bot searches.
+MAX_BOTS = max(1, int(os.environ.get("MAX_BOTS", 100)) // SHARDS)  # Rooms this shard will seat a bot in at once.
+BOT_FILL_DELAY = float(os.environ.get("BOT_FILL_DELAY", 20))  # Seconds before a bot takes an empty seat; 0 disables.
+BOT_SID = "bot"  # Stands in for a sid in the seat a bot occupies.
+DIFFICULTIES = ("easy", "medium", "hard")  # The levels game_logic.ai_move understands.
+MAX_SPECTATORS = int(os.environ.get("MAX_SPECTATORS", 1000))  # Watchers allowed per room.
+SPECTATOR_BACKLOG = int(os.environ.get("SPECTATOR_BACKLOG", 8))  # Unsent frames before a watcher is skipped.
+SPECTATOR_RESYNC_INTERVAL = 0.5  # Seconds between checks on whether a skipped watcher has caught up.
+
+sio = socketio.AsyncServer(async_mode="aiohttp", cors_allowed_origins="*")
+app = web.Application()
+sio.attach(app)
+
+# ----------------------------------
+# Rooms
+# ----------------------------------
+rooms = {}        # room code -> {"seats": {"X": sid, "O": sid}, "variant": "3x3", "board": [...], "bot": None, ...}
+player_room = {}  # sid -> room code
+
+def new_room(variant=DEFAULT_VARIANT):
+    return {"seats": {"X": None, "O": None}, "variant": variant, "board": game_logic.new_board(), "bot": None,
+            "quick_match": False, "spectators": {}, "stale": set()}
+
+# asyncio only keeps weak references to tasks, so fire-and-forget work is held
+# here until it finishes.
+background_tasks = set()
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def new_room_code():
+    # The first character names the shard. Each shard owns its prefix, so checking
+    # its own rooms keeps codes unique without a lock shared between processes.
+    # The suffix is random so codes can't be guessed from one another.
+    while True:
+        code = ROOM_CODE_CHARS[SHARD_ID] + ''.join(secrets.choice(ROOM_CODE_CHARS) for _ in range(5))
+        if code not in rooms:
+            return code
+
+def shard_of(code):
+    if len(code) != 6 or code[0] not in ROOM_CODE_CHARS:
+        return None
+    shard = ROOM_CODE_CHARS.index(code[0])
+    return shard if shard < SHARDS else None
+
+async def seat_player(code, sid, difficulty="hard"):
+    room = rooms[code]
+    free = [mark for mark, seat in room["seats"].items() if seat is None]
+    if not free:
+        await sio.emit('error', {'message': "Room " + code + " is full."}, to=sid)
+        return
+    mark = free[0]
+    room["seats"][mark] = sid
+    player_room[sid] = code
+    await sio.enter_room(sid, code)
+    await sio.emit('mark', {'mark': mark}, to=sid)
+    if len(free) == 1:
+        await sio.emit('start', {'message': "X goes first."}, room=code)
+    elif not room["quick_match"]:
+        # Quick-match rooms are filled straight away, so their first seat never waits.
+        await sio.emit('waiting', {'message': "Waiting for an opponent to join " + code + "..."}, to=sid)
+        if BOT_FILL_DELAY > 0 and mark == "X":
+            spawn(fill_with_bot_later(code, difficulty))
+
+async def leave_room(sid):
+    code = player_room.pop(sid, None)
+    if code is None:
+        return
+    room = rooms[code]
+    for mark, seat in room["seats"].items():
+        if seat == sid:
+            room["seats"][mark] = None
+    await sio.leave_room(sid, code)
+    if all(seat in (None, BOT_SID) for seat in room["seats"].values()):
+        del rooms[code]
+        bot_waitlist.pop(code, None)
+        # Detach every watcher before the first await, so one disconnecting
+        # while the others are told can't find its room half torn down.
+        watchers = list(room["spectators"])
+        for watcher in watchers:
+            del spectator_room[watcher]
+        if room["bot"] is not None:
+            await release_bot()
+        for watcher in watchers:
+            await sio.emit('spectate_end', {'message': "The players have left room " + code + "."}, to=watcher)
+    else:
+        await sio.emit('waiting', {'message': "Your opponent left the room."}, room=code)
+
+def current_turn(board):
+    # Same rule as the client's compute_current_turn: X moves on an even count.
+    move_count = sum(1 for row in board for cell in row if cell is not None)
+    return "X" if move_count % 2 == 0 else "O"
+
+def apply_move(room, sid, row, col):
+    board = room["board"]
+    if game_logic.check_winner(board):
+        # The players restarted locally after the last game ended; follow them.
+        board = game_logic.new_board()
+    if not (isinstance(row, int) and isinstance(col, int) and 0 <= row < 3 and 0 <= col < 3):
+        return False
+    mark = next(mark for mark, seat in room["seats"].items() if seat == sid)
+    if mark != current_turn(board) or board[row][col] is not None:
+        return False
+    board[row][col] = mark
+    room["board"] = board
+    return True
+
+# ----------------------------------
+# Spectators
+# ----------------------------------
+# Watchers are kept out of the Socket.IO room so the players' own 'move' emits
+# never wait on them. Each update is encoded into a Socket.IO frame once and the
+# same frame is handed to every watcher's engine.io connection. A watcher whose
+# outgoing queue already holds SPECTATOR_BACKLOG frames is skipped rather than
+# buffered without bound. Once its queue has drained it gets a single snapshot
+# in place of everything it missed. Watchers that never drain are dropped by
+# engine.io's ping timeout.
+spectator_room = {}  # sid -> room code
+spectator_frames_sent = 0
+spectator_frames_dropped = 0
+
+# python-socketio has no public way to send a pre-encoded frame or to see how
+# far behind a connection is, so these four helpers are the only code that
+# reaches into engine.io. Written against python-socketio 5.11 and
+# python-engineio 4.9.
+def encode_event(event, data):
+    # sio.packet_class honours the server's serializer and json module.
+    frames = sio.packet_class(socketio.packet.EVENT, data=[event, data]).encode()
+    return frames if isinstance(frames, list) else [frames]
+
+def eio_sid_of(sid):
+    return sio.manager.eio_sid_from_sid(sid, "/")
+
+def send_backlog(eio_sid):
+    # Frames queued for the connection, or None once it has gone.
+    socket = sio.eio.sockets.get(eio_sid)
+    if socket is None or socket.closed:
+        return None
+    return socket.queue.qsize()
+
+async def send_frames(eio_sid, frames):
+    for frame in frames:
+        await sio.eio.send(eio_sid, frame)
+
+def snapshot(code, room):
+    return {'room': code, 'board': room["board"]}
+
+async def add_spectator(code, sid):
+    room = rooms[code]
+    if len(room["spectators"]) >= MAX_SPECTATORS:
+        await sio.emit('spectate_end', {'message': "Room " + code + " has no spectator spots left."}, to=sid)
+        return
+    room["spectators"][sid] = eio_sid_of(sid)
+    spectator_room[sid] = code
+    # A late joiner gets the current board in one message, not a replay of the moves.
+    await sio.emit('snapshot', snapshot(code, room), to=sid)
+
+def remove_spectator(sid):
+    code = spectator_room.pop(sid, None)
+    room = rooms.get(code)
+    if room is not None:
+        del room["spectators"][sid]
+        room["stale"].discard(sid)
+
+async def broadcast_move(code, room, row, col, mark):
+    global spectator_frames_sent, spectator_frames_dropped
+    frames = encode_event('spectate_move', {'row': row, 'col': col, 'mark': mark})
+    for sid, eio_sid in list(room["spectators"].items()):
+        if sid in room["stale"]:
+            spectator_frames_dropped += 1
+            continue
+        backlog = send_backlog(eio_sid)
+        if backlog is None:
+            continue
+        if backlog >= SPECTATOR_BACKLOG:
+            room["stale"].add(sid)
+            spectator_frames_dropped += 1
+            spawn(resync_when_drained(code, sid))
+            continue
+        await send_frames(eio_sid, frames)
+        spectator_frames_sent += 1
+
+async def resync_when_drained(code, sid):
+    # Don't wait for another move: the skipped one may have ended the game.
+    while True:
+        await asyncio.sleep(SPECTATOR_RESYNC_INTERVAL)
+        room = rooms.get(code)
+        if room is None or sid not in room["spectators"]:
+            return
+        eio_sid = room["spectators"][sid]
+        backlog = send_backlog(eio_sid)
+        if backlog is None:
+            return
+        if backlog == 0:
+            room["stale"].discard(sid)
+            await send_frames(eio_sid, encode_event('snapshot', snapshot(code, room)))
+            return
+
+# ----------------------------------
+# Bot Opponents
+# ----------------------------------
+# Searches run in a process pool so a hard-mode minimax never stalls the event
+# loop. At most BOT_WORKERS searches are handed to the pool at a time; the rest
+# queue on the semaphore. Rooms that want a bot once MAX_BOTS are seated wait in
+# bot_waitlist until one frees up.
+bot_pool = None
+bot_slots = None
+bots_seated = 0
+bot_waitlist = collections.OrderedDict()  # room code -> difficulty
+bot_searches_running = 0
+bot_searches_queued = 0
+bot_move_latency = collections.deque(maxlen=WAIT_SAMPLES)
+
+async def start_bot_pool(app):
+    global bot_pool, bot_slots
+    # Reseed each worker so forked processes don't all roll the same "random" moves.
+    bot_pool = concurrent.futures.ProcessPoolExecutor(BOT_WORKERS, initializer=random.seed)
+    bot_slots = asyncio.Semaphore(BOT_WORKERS)
+
+async def stop_bot_pool(app):
+    bot_pool.shutdown(cancel_futures=True)
+
+async def fill_with_bot_later(code, difficulty):
+    await asyncio.sleep(BOT_FILL_DELAY)
+    await fill_with_bot(code, difficulty)
+
+async def fill_with_bot(code, difficulty):
+    global bots_seated
+    room = rooms.get(code)
+    if room is None or room["seats"]["X"] is None or room["seats"]["O"] is not None:
+        return
+    if bots_seated >= MAX_BOTS:
+        bot_waitlist[code] = difficulty
+        await sio.emit('waiting', {'message': "Still waiting for an opponent..."}, room=code)
+        return
+    bots_seated += 1
+    room["bot"] = difficulty
+    room["seats"]["O"] = BOT_SID
+    await sio.emit('start', {'message': "No one joined, so a " + difficulty + " bot will play O."}, room=code)
+    # X may already have moved while waiting for an opponent.
+    if current_turn(room["board"]) == "O" and not game_logic.check_winner(room["board"]):
+        spawn(play_bot_move(code))
+
+async def release_bot():
+    global bots_seated
+    bots_seated -= 1
+    # Skip waitlisted rooms that found a human opponent or closed in the meantime.
+    while bot_waitlist and bots_seated < MAX_BOTS:
+        code, difficulty = bot_waitlist.popitem(last=False)
+        await fill_with_bot(code, difficulty)
+
+async def play_bot_move(code):
+    global bot_searches_running, bot_searches_queued
+    room = rooms.get(code)
+    if room is None:
+        return
+    board = [row[:] for row in room["board"]]
+    started = time.monotonic()
+    bot_searches_queued += 1
+    async with bot_slots:
+        bot_searches_queued -= 1
+        bot_searches_running += 1
+        try:
+            move = await asyncio.get_running_loop().run_in_executor(bot_pool, game_logic.ai_move, board, room["bot"])
+        finally:
+            bot_searches_running -= 1
+    bot_move_latency.append(time.monotonic() - started)
+    # The player may have left while the bot was thinking.
+    if move is None or rooms.get(code) is not room:
+        return
+    row, col = move
+    if apply_move(room, BOT_SID, row, col):
+        await sio.emit('move', {'row': row, 'col': col}, room=code)
+        if room["spectators"]:
+            spawn(broadcast_move(code, room, row, col, room["board"][row][col]))
+
+# ----------------------------------
+# Quick Match Queue
+# ----------------------------------
+# One FIFO per board variant. An OrderedDict gives O(1) enqueue, O(1) pop of the
+# longest waiter and O(1) removal when a queued player disconnects.
+match_queues = {}  # variant -> OrderedDict of sid -> enqueued at; dropped once empty
+queued_variant = {}  # sid -> variant
+wait_times = collections.deque(maxlen=WAIT_SAMPLES)
+matches_made = 0
+
+async def quick_match(sid, variant):
+    global matches_made
+    queue = match_queues.get(variant)
+    if not queue:
+        match_queues[variant] = collections.OrderedDict({sid: time.monotonic()})
+        queued_variant[sid] = variant
+        await sio.emit('waiting', {'message': "Looking for an opponent..."}, to=sid)
+        return
+    opponent, enqueued_at = queue.popitem(last=False)
+    if not queue:
+        del match_queues[variant]
+    del queued_variant[opponent]
+    # Only the queued player waited; the one who completed the match was paired at once.
+    wait_times.append(time.monotonic() - enqueued_at)
+    matches_made += 1
+    code = new_room_code()
+    rooms[code] = new_room(variant)
+    rooms[code]["quick_match"] = True
+    # The player who waited longest takes the first seat and moves first.
+    for player in (opponent, sid):
+        await sio.emit('matched', {'room': code}, to=player)
+        await seat_player(code, player)
+
+def leave_queue(sid):
+    variant = queued_variant.pop(sid, None)
+    if variant is not None:
+        queue = match_queues[variant]
+        del queue[sid]
+        if not queue:
+            del match_queues[variant]
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# ----------------------------------
+# Socket.IO Events
+# ----------------------------------
+@sio.event
+async def connect(sid, environ):
+    print("Client connected:", sid)
+
+@sio.event
+async def disconnect(sid):
+    print("Client disconnected:", sid)
+    leave_queue(sid)
+    remove_spectator(sid)
+    await leave_room(sid)
+
+@sio.on('create')
+async def on_create(sid, data):
+    data = data or {}
+    if sid in player_room or sid in queued_variant or sid in spectator_room:
+        await sio.emit('error', {'message': "You are already in a game."}, to=sid)
+        return
+    code = new_room_code()
+    rooms[code] = new_room()
+    await sio.emit('created', {'room': code}, to=sid)
+    difficulty = data.get("difficulty")
+    await seat_player(code, sid, difficulty if difficulty in DIFFICULTIES else "hard")
+
+@sio.on('join')
+async def on_join(sid, data):
+    data = data or {}
+    code = (data.get("room") or "").upper()
+    if code not in rooms:
+        await sio.emit('error', {'message': "No room with code " + code + "."}, to=sid)
+        return
+    if sid in player_room or sid in queued_variant or sid in spectator_room:
+        await sio.emit('error', {'message': "You are already in a game."}, to=sid)
+        return
+    await seat_player(code, sid)
+
+@sio.on('spectate')
+async def on_spectate(sid, data):
+    data = data or {}
+    code = (data.get("room") or "").upper()
+    if code not in rooms:
+        await sio.emit('spectate_end', {'message': "No room with code " + code + "."}, to=sid)
+        return
+    if sid in player_room or sid in queued_variant or sid in spectator_room:
+        await sio.emit('error', {'message': "You are already in a game."}, to=sid)
+        return
+    await add_spectator(code, sid)
+
+@sio.on('quick_match')
+async def on_quick_match(sid, data):
+    data = data or {}
+    if sid in player_room or sid in queued_variant or sid in spectator_room:
+        await sio.emit('error', {'message': "You are already in a game."}, to=sid)
+        return
+    variant = data.get("variant", DEFAULT_VARIANT)
+    if variant not in VARIANTS:
+        await sio.emit('error', {'message': "Quick match isn't available for that board."}, to=sid)
+        return
+    await quick_match(sid, variant)
+
+@sio.on('leave_queue')
+async def on_leave_queue(sid, data=None):
+    leave_queue(sid)
+
+@sio.on('move')
+async def on_move(sid, data):
+    data = data or {}
+    code = data.get("room")
+    if player_room.get(sid) != code:
+        await sio.emit('error', {'message': "You are not in room " + str(code) + "."}, to=sid)
+        return
+    room = rooms[code]
+    row, col = data.get("row"), data.get("col")
+    if not apply_move(room, sid, row, col):
+        await sio.emit('error', {'message': "Illegal move."}, to=sid)
+        return
+    await sio.emit('move', {'row': row, 'col': col}, room=code, skip_sid=sid)
+    if room["spectators"]:
+        spawn(broadcast_move(code, room, row, col, room["board"][row][col]))
+    if room["bot"] is not None and not game_logic.check_winner(room["board"]):
+        spawn(play_bot_move(code))
+
+# ----------------------------------
+# Shard Routing
+# ----------------------------------
+# Any shard can answer: a room's shard is read straight off its code, quick
+# match buckets by variant so players of one variant meet on the same shard,
+# and new rooms are spread at random. Matched games stay on their queue's
+# shard, so with only 3x3 all quick-match play runs on a single shard.
+async def route(request):
+    room = request.query.get("room")
+    variant = request.query.get("variant")
+    if room:
+        shard = shard_of(room.upper())
+        if shard is None:
+            return web.json_response({"error": "No room with code " + room + "."}, status=404)
+    elif variant:
+        shard = zlib.crc32(variant.encode()) % SHARDS  # hash() differs between processes.
+    else:
+        shard = random.randrange(SHARDS)
+    if SHARD_URL:
+        url = SHARD_URL.format(shard=shard, port=PORT + shard)
+    elif SHARDS > 1:
+        url = f"{request.scheme}://{request.url.host}:{PORT + shard}"
+    else:
+        url = None  # Single process: stay on the URL the client already has.
+    return web.json_response({"shard": shard, "url": url})
+
+# ----------------------------------
+# Metrics
+# ----------------------------------
+async def metrics(request):
+    samples = list(wait_times)
+    latencies = list(bot_move_latency)
+    return web.json_response({
+        "shard": SHARD_ID,
+        "rooms": len(rooms),
+        "players": len(player_room),
+        "spectators": {
+            "watching": len(spectator_room),
+            "behind": sum(len(room["stale"]) for room in rooms.values()),
+            "frames_sent": spectator_frames_sent,
+            "frames_dropped": spectator_frames_dropped,
+        },
+        "quick_match": {
+            "queued": {variant: len(queue) for variant, queue in match_queues.items()},
+            "matches": matches_made,
+            "wait_seconds": {
+                "samples": len(samples),
+                "p50": percentile(samples, 0.50),
+                "p95": percentile(samples, 0.95),
+                "max": max(samples) if samples else None,
+            },
+        },
+        "bots": {
+            "seated": bots_seated,
+            "max": MAX_BOTS,
+            "waitlisted": len(bot_waitlist),
+            "pool_workers": BOT_WORKERS,
+            "searches_running": bot_searches_running,
+            "searches_queued": bot_searches_queued,
+            "pool_saturation": bot_searches_running / BOT_WORKERS,
+            "move_latency_seconds": {
+                "samples": len(latencies),
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "max": max(latencies) if latencies else None,
+            },
+        },
+    })
+
+app.router.add_get("/route", route)
+app.router.add_get("/metrics", metrics)
+app.on_startup.append(start_bot_pool)
+app.on_cleanup.append(stop_bot_pool)
+
+def run_shard(shard_id):
+    global SHARD_ID
+    SHARD_ID = shard_id
+    print(f"Shard {shard_id} of {SHARDS} listening on port {PORT + shard_id}")
+    web.run_app(app, host=HOST, port=PORT + shard_id, print=None)
+
+if __name__ == "__main__":
+    if not 1 <= SHARDS <= len(ROOM_CODE_CHARS):
+        sys.exit(f"SHARDS must be between 1 and {len(ROOM_CODE_CHARS)}.")
+    if SHARDS == 1:
+        run_shard(0)
+    else:
+        workers = [multiprocessing.Process(target=run_shard, args=(i,)) for i in range(SHARDS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 import os
 import sys
-import random
 import math
+import json
+import collections
 import threading
+import urllib.parse
+import urllib.request
 import pygame
 import socketio
+import game_logic
 
 # ----------------------------------
 # Pygame Initialization & Settings
@@ -70,6 +74,8 @@ remote_move = None
 your_mark = None
 opponent_mark = None
 room_code_global = None
+server_error = None  # Last 'error' message from the server since connecting
+spectator_updates = collections.deque()  # ("snapshot", board), ("move", row, col, mark) or ("end", message), oldest first
 
 @sio.event
 def connect():
@@ -94,28 +100,85 @@ def handle_move(data):
     remote_move = (row, col)
     print(f"Received move: row {row}, col {col}")
 
+@sio.on('created')
+def on_created(data):
+    global room_code_global
+    room_code_global = data.get("room")
+    print(f"Created room {room_code_global}")
+
+@sio.on('matched')
+def on_matched(data):
+    global room_code_global
+    room_code_global = data.get("room")
+    print(f"Matched into room {room_code_global}")
+
+@sio.on('snapshot')
+def on_snapshot(data):
+    spectator_updates.append(("snapshot", data.get("board")))
+    print(f"Received snapshot of room {data.get('room')}")
+
+@sio.on('spectate_move')
+def on_spectate_move(data):
+    spectator_updates.append(("move", data.get("row"), data.get("col"), data.get("mark")))
+
+@sio.on('spectate_end')
+def on_spectate_end(data):
+    spectator_updates.append(("end", data.get("message")))
+    print("Stopped watching:", data.get("message"))
+
 @sio.on('start')
 def on_start(data):
     print("Game starting! " + data.get("message", ""))
 
 @sio.on('error')
 def on_error(data):
-    print("Error:", data.get("message"))
+    global server_error
+    server_error = data.get("message") or "Unknown error."
+    print("Error:", server_error)
 
 @sio.on('waiting')
 def on_waiting(data):
     print(data.get("message"))
 
-def connect_to_server(server_ip, server_port, room_code):
-    global room_code_global
+def shard_url(server_url, params):
+    # A sharded server hosts each room in one worker process; ask it which one.
+    try:
+        with urllib.request.urlopen(server_url + "/route?" + urllib.parse.urlencode(params), timeout=5) as resp:
+            return json.load(resp).get("url") or server_url
+    except (OSError, ValueError) as e:
+        print("Could not look up the room's shard, using the main server.", e)
+        return server_url
+
+def connect_to_server(server_ip, server_port, selection, room_code=None):
+    global room_code_global, your_mark, server_error
     room_code_global = room_code
+    your_mark = None  # Forget the mark from any previous online game.
+    server_error = None
+    variant = f"{BOARD_ROWS}x{BOARD_COLS}"
+    # A full URL (e.g. http://127.0.0.1:5000 for local testing) is used as-is.
+    if server_ip.startswith(("http://", "https://")):
+        server_url = server_ip
     # If server_port is None, skip adding it.
-    if server_port:
+    elif server_port:
         server_url = f"https://{server_ip}:{server_port}"
     else:
         server_url = f"https://{server_ip}"
-    sio.connect(server_url)
-    sio.emit('join', {'room': room_code})
+    if selection == "create":
+        sio.connect(shard_url(server_url, {}))
+        # The server allocates the code and reports it through 'created'.
+        # The difficulty is used if the server fills the empty seat with a bot.
+        sio.emit('create', {'difficulty': difficulty})
+    elif selection == "quick":
+        sio.connect(shard_url(server_url, {'variant': variant}))
+        # Quick match: the server picks the room and reports it through 'matched'.
+        sio.emit('quick_match', {'variant': variant})
+    elif selection == "watch":
+        spectator_updates.clear()  # Drop anything left over from watching another room.
+        sio.connect(shard_url(server_url, {'room': room_code}))
+        sio.emit('spectate', {'room': room_code})
+    else:
+        sio.connect(shard_url(server_url, {'room': room_code}))
+        sio.emit('join', {'room': room_code})
 
 
 def send_move(row, col):
@@ -267,111 +330,14 @@ def select_difficulty():
 # Game Logic Functions
 # ----------------------------------
 def available_moves():
-    return [(r, c) for r in range(BOARD_ROWS) for c in range(BOARD_COLS) if board[r][c] is None]
+    return game_logic.available_moves(board)
 
 def check_winner():
-    for row in range(BOARD_ROWS):
-        if board[row][0] == board[row][1] == board[row][2] and board[row][0] is not None:
-            return board[row][0]
-    for col in range(BOARD_COLS):
-        if board[0][col] == board[1][col] == board[2][col] and board[0][col] is not None:
-            return board[0][col]
-    if board[0][0] == board[1][1] == board[2][2] and board[0][0] is not None:
-        return board[0][0]
-    if board[0][2] == board[1][1] == board[2][0] and board[0][2] is not None:
-        return board[0][2]
-    if all(board[r][c] is not None for r in range(BOARD_ROWS) for c in range(BOARD_COLS)):
-        return "Draw"
-    return None
-
-def minimax(depth, is_maximizing):
-    winner = check_winner()
-    if winner == "O":  # AI wins
-        return 10 - depth  # Winning faster is better
-    elif winner == "X":  # Player wins
-        return depth - 10  # Losing later is better (forces mistakes)
-    elif winner == "Draw":
-        return 0  # Neutral value for draw
-
-    if is_maximizing:
-        best_score = -float("inf")
-        for row, col in available_moves():
-            board[row][col] = "O"
-            score = minimax(depth + 1, False)
-            board[row][col] = None
-            best_score = max(best_score, score)
-        return best_score
-    else:
-        best_score = float("inf")
-        for row, col in available_moves():
-            board[row][col] = "X"
-            score = minimax(depth + 1, True)
-            board[row][col] = None
-            best_score = min(best_score, score)
-        return best_score
-
-
-def can_set_trap():
-    for row, col in available_moves():
-        board[row][col] = "O"  # Temporarily place AI move
-        win_paths = 0  # Count how many ways this leads to a win
-        
-        # Check if making this move results in two simultaneous threats
-        if check_winner() == "O":
-            win_paths += 1  # First winning path detected
-        
-        # Now check for another potential win path after blocking
-        opponent_moves = available_moves()
-        for op_row, op_col in opponent_moves:
-            board[op_row][op_col] = "X"  # Simulate opponent's best blocking move
-            if check_winner() == "O":
-                win_paths += 1  # Another winning path detected
-            board[op_row][op_col] = None  # Undo opponent simulation
-        
-        board[row][col] = None  # Undo AI simulation
-        
-        if win_paths >= 2:
-            return row, col  # If two threats exist, return this trap move
-    
-    return None  # No trap available
+    return game_logic.check_winner(board)
 
 def ai_move():
     global difficulty
-    if difficulty == "easy":
-        moves = available_moves()
-        if moves:
-            return random.choice(moves)
-    elif difficulty == "medium":
-        if random.random() < 0.25:
-            moves = available_moves()
-            if moves:
-                return random.choice(moves)
-        best_score = -float("inf")
-        best_move = None
-        for row, col in available_moves():
-            board[row][col] = "O"
-            score = minimax(0, False)
-            board[row][col] = None
-            if score > best_score:
-                best_score = score
-                best_move = (row, col)
-        return best_move
-    else:  # Hard mode
-        trap_move = can_set_trap()
-        if trap_move:
-            return trap_move  # Prioritize trapping the opponent
-        
-        # Otherwise, use standard minimax logic
-        best_score = -float("inf")
-        best_move = None
-        for row, col in available_moves():
-            board[row][col] = "O"
-            score = minimax(0, False)
-            board[row][col] = None
-            if score > best_score:
-                best_score = score
-                best_move = (row, col)
-        return best_move
+    return game_logic.ai_move(board, difficulty)
 
 def animate_move(row, col, mark):
     # Update the board immediately (if you prefer this approach)
@@ -582,6 +548,48 @@ def online_pvp_game_loop():
         pygame.display.update()
         clock.tick(30)
 
+def spectate_game_loop():
+    global board
+    restart_game()
+    ended = False
+    clock = pygame.time.Clock()
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit(); sys.exit()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                if sio.connected:
+                    sio.disconnect()
+                return
+        while spectator_updates:
+            update = spectator_updates.popleft()
+            if update[0] == "snapshot":
+                board = update[1]
+            elif update[0] == "end":
+                # The room closed (or never existed); keep the last board on screen.
+                ended = True
+                sio.disconnect()
+            else:
+                _, r, c, mark = update
+                if check_winner():
+                    # The players have started a new game.
+                    board = game_logic.new_board(BOARD_ROWS, BOARD_COLS)
+                animate_move(r, c, mark)
+
+        fill_gradient(screen, GRADIENT_TOP, GRADIENT_BOTTOM)
+        draw_lines()
+        draw_figures()
+        winner = check_winner()
+        if ended:
+            indicator_text = "Room Closed (Esc)"
+        elif winner:
+            indicator_text = "It's a Draw!" if winner == "Draw" else f"{winner} Wins!"
+        else:
+            indicator_text = f"Watching ({compute_current_turn()}'s Turn)"
+        draw_turn_indicator(indicator_text)
+        pygame.display.update()
+        clock.tick(30)
+
 # ----------------------------------
 # UI Menus
 # ----------------------------------
@@ -623,12 +631,15 @@ def main_menu():
 
 def room_menu():
     joining = False
+    watching = False       # Whether the typed code is for watching rather than playing
     typed_code = ""
     create_room_button = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 - 100, 300, 50)
     join_room_button   = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 - 30, 300, 50)
-    back_button        = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 + 40, 300, 50)
+    quick_match_button = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 + 40, 300, 50)
+    watch_room_button  = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 + 110, 300, 50)
+    back_button        = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 + 180, 300, 50)
     room_menu_active = True
-    result_mode = None     # "create" or "join"
+    result_mode = None     # "create", "join", "quick" or "watch"
     room_code = ""
     
     while room_menu_active:
@@ -638,11 +649,13 @@ def room_menu():
         screen.blit(title_text, title_rect)
         draw_button(screen, create_room_button, "Create Room", button_font, BUTTON_COLOR, TEXT_COLOR)
         draw_button(screen, join_room_button, "Join Room", button_font, BUTTON_COLOR, TEXT_COLOR)
+        draw_button(screen, quick_match_button, "Quick Match", button_font, BUTTON_COLOR, TEXT_COLOR)
+        draw_button(screen, watch_room_button, "Watch Room", button_font, BUTTON_COLOR, TEXT_COLOR)
         draw_button(screen, back_button, "Back", button_font, BUTTON_COLOR, TEXT_COLOR)
         
         if joining:
             prompt_text = button_font.render("Enter Room Code: " + typed_code, True, TEXT_COLOR)
-            prompt_rect = prompt_text.get_rect(center=(WIDTH//2, HEIGHT//2 + 120))
+            prompt_rect = prompt_text.get_rect(center=(WIDTH//2, HEIGHT//2 + 250))
             screen.blit(prompt_text, prompt_rect)
         
         pygame.display.update()
@@ -653,11 +666,20 @@ def room_menu():
                 mouse_pos = event.pos
                 if create_room_button.collidepoint(mouse_pos):
                     result_mode = "create"
-                    room_code = ''.join(random.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=6))
+                    room_code = None  # Allocated by the server so it is unique.
                     room_menu_active = False
                     break
                 elif join_room_button.collidepoint(mouse_pos):
                     joining = True
+                    watching = False
+                elif watch_room_button.collidepoint(mouse_pos):
+                    joining = True
+                    watching = True
+                elif quick_match_button.collidepoint(mouse_pos):
+                    result_mode = "quick"
+                    room_code = None  # Assigned by the server once an opponent is found.
+                    room_menu_active = False
+                    break
                 elif back_button.collidepoint(mouse_pos):
                     result_mode = None
                     room_menu_active = False
@@ -665,8 +687,8 @@ def room_menu():
             if event.type == pygame.KEYDOWN and joining:
                 if event.key == pygame.K_RETURN:
                     if typed_code != "":
-                        result_mode = "join"
-                        room_code = typed_code
+                        result_mode = "watch" if watching else "join"
+                        room_code = typed_code.upper()
                         room_menu_active = False
                         break
                 elif event.key == pygame.K_BACKSPACE:
@@ -679,6 +701,8 @@ def display_room_info(room_code, selection):
     fill_gradient(screen, GRADIENT_TOP, GRADIENT_BOTTOM)
     if selection == "create":
         message = "Room Created!\nCode: " + room_code + "\nShare this code with a friend."
+    elif selection == "watch":
+        message = "Watching Room:\n" + room_code + "\nPress Esc to leave."
     else:
         message = "Joining Room:\n" + room_code
     lines = message.split("\n")
@@ -695,6 +719,34 @@ def display_room_info(room_code, selection):
                 return
         pygame.time.wait(100)
 
+def wait_for_server(selection, lines, ready):
+    # Quick match can take any amount of time, so keep the window responsive
+    # until ready() says the server has answered. Esc gives up; a server error
+    # (e.g. a mistyped room code) stays on screen until the player goes back.
+    clock = pygame.time.Clock()
+    while server_error is not None or not ready():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit(); sys.exit()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                if sio.connected:
+                    if selection == "quick":
+                        sio.emit('leave_queue')
+                    sio.disconnect()
+                return False
+        fill_gradient(screen, GRADIENT_TOP, GRADIENT_BOTTOM)
+        if server_error is not None:
+            shown = ["Something went wrong:", server_error, "Press Esc to go back."]
+        else:
+            shown = lines + ["Press Esc to cancel."]
+        for idx, line in enumerate(shown):
+            line_surf = button_font.render(line, True, TEXT_COLOR)
+            line_rect = line_surf.get_rect(center=(WIDTH//2, HEIGHT//2 - 40 + idx * 40))
+            screen.blit(line_surf, line_rect)
+        pygame.display.update()
+        clock.tick(30)
+    return True
+
 def draw_restart_menu(winner):
     menu_active = True
     restart_button = pygame.Rect(WIDTH//2 - 150, HEIGHT//2, 300, 50)
@@ -731,16 +783,31 @@ def main():
             pvp_game_loop()
         elif mode == "online":
             selection, room_code = room_menu()
-            if not room_code:
+            if selection is None:
                 continue
-            display_room_info(room_code, selection)
-            # Replace with your Render service hostname.
-            server_ip = "server"
+            if selection not in ("create", "quick"):
+                display_room_info(room_code, selection)
+            # Replace with your Render service hostname, or set TICTACTOE_SERVER.
+            server_ip = os.environ.get("TICTACTOE_SERVER", "server")
             # Optionally remove the port if not needed – ensure connect_to_server handles a None port appropriately.
-            connect_to_server(server_ip, None, room_code)
+            connect_to_server(server_ip, None, selection, room_code)
+            if selection == "create":
+                # Wait for the server to hand out the room code.
+                if not wait_for_server(selection, ["Creating a room..."], lambda: room_code_global is not None):
+                    continue
+                display_room_info(room_code_global, selection)
+            if selection == "watch":
+                spectate_game_loop()
+                continue
+            if selection == "quick":
+                lines = ["Quick Match", "Looking for an opponent..."]
+            elif selection == "create":
+                lines = ["Room Created!", "Code: " + room_code_global]
+            else:
+                lines = ["Joining Room:", room_code_global]
             # Wait for the server to assign a mark.
-            while your_mark is None:
-                pygame.time.wait(100)
+            if not wait_for_server(selection, lines, lambda: your_mark is not None):
+                continue
             online_pvp_game_loop()
 
 if __name__ == "__main__":